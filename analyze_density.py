@@ -13,10 +13,21 @@ Algorithm:
 """
 
 import os
-import json
+import math
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from PIL import Image
 import numpy as np
+from scipy import ndimage
+
+from image_io import load_grayscale
+from json_io import write_json
+from numba_jit import HAVE_NUMBA, njit
+
+try:
+    import cv2
+except ImportError:  # OpenCV is optional - fall back to PIL decoding
+    cv2 = None
 
 # Analysis parameters
 CELL_SIZE = 8  # Analyze in 8x8 pixel blocks
@@ -31,161 +42,267 @@ LOW_DENSITY = 0.30    # <30% white = dark barrier
 # Minimum zone dimensions (in cells)
 MIN_ZONE_CELLS_W = 15  # 15 cells * 8px = 120px minimum width
 MIN_ZONE_CELLS_H = 5   # 5 cells * 8px = 40px minimum height
+MAX_ZONE_CELLS_H = 19  # Tallest band scanned for zones (19 cells * 8px = 152px)
+MAX_ZONES = 5          # Text zones reported per image, largest first
+
+# Images handed to each process pool worker call (they share scratch buffers)
+BATCH_SIZE = 8
+
+# Per-cell pixel counts equivalent to the ratio thresholds, so the grids
+# can stay as integer counts and be compared without dividing
+CELL_COUNT = CELL_SIZE * CELL_SIZE
+HIGH_DENSITY_COUNT = math.ceil(HIGH_DENSITY * CELL_COUNT)  # white count >= this
+BARRIER_COUNT = CELL_COUNT // 2                            # black count > this
+
+
+def cell_counts(mask, grid_h, grid_w):
+    """Number of set pixels in each CELL_SIZE x CELL_SIZE cell of a 0/1 mask (uint16)."""
+    cropped = mask[:grid_h * CELL_SIZE, :grid_w * CELL_SIZE]
+
+    if cv2 is not None and grid_h and grid_w:
+        # INTER_AREA on a whole-factor downscale is a box average (SIMD in OpenCV);
+        # the float32 means are only exact for power-of-two cells, so round back
+        # to whole counts rather than truncating
+        means = cv2.resize(cropped.astype(np.float32), (grid_w, grid_h),
+                           interpolation=cv2.INTER_AREA)
+        return np.rint(means * CELL_COUNT).astype(np.uint16)
+
+    return cropped.reshape(grid_h, CELL_SIZE, grid_w, CELL_SIZE).sum(axis=(1, 3), dtype=np.uint16)
 
 
 def analyze_image(image_path):
     """Analyze dither density for text zone identification."""
-    img = Image.open(image_path).convert('L')
-    pixels = np.array(img)
+    return analyze_pixels(load_grayscale(image_path), os.path.basename(image_path))
+
+
+def analyze_pixels(pixels, filename, masks=None):
+    """Analyze a grayscale pixel array for text zone identification.
 
+    masks is an optional (2, height, width) bool scratch buffer for the
+    white/black threshold masks, so batches of same-sized images can reuse it.
+    """
     height, width = pixels.shape
 
     # Create density grid
     grid_h = height // CELL_SIZE
     grid_w = width // CELL_SIZE
 
-    density_grid = np.zeros((grid_h, grid_w))
-    barrier_grid = np.zeros((grid_h, grid_w), dtype=bool)
+    # Per-pixel masks, computed once into the scratch buffer and read as uint8 views
+    if masks is None:
+        masks = np.empty((2, height, width), dtype=bool)
+    wmask = np.greater_equal(pixels, WHITE_THRESHOLD, out=masks[0]).view(np.uint8)
+    bmask = np.less_equal(pixels, BLACK_THRESHOLD, out=masks[1]).view(np.uint8)
 
-    for gy in range(grid_h):
-        for gx in range(grid_w):
-            y1, y2 = gy * CELL_SIZE, (gy + 1) * CELL_SIZE
-            x1, x2 = gx * CELL_SIZE, (gx + 1) * CELL_SIZE
-            cell = pixels[y1:y2, x1:x2]
+    # Density grid as white pixel counts per cell; ratios are only formed for output
+    white_counts = cell_counts(wmask, grid_h, grid_w)
 
-            white_count = np.sum(cell >= WHITE_THRESHOLD)
-            black_count = np.sum(cell <= BLACK_THRESHOLD)
-            total = cell.size
-
-            density_grid[gy, gx] = white_count / total
-
-            # Mark as barrier if high black density (likely edge/border)
-            barrier_grid[gy, gx] = (black_count / total) > 0.5
+    # Mark as barrier if high black density (likely edge/border)
+    barrier_grid = cell_counts(bmask, grid_h, grid_w) > BARRIER_COUNT
 
     # Find contiguous high-density zones
-    high_density_mask = density_grid >= HIGH_DENSITY
+    high_density_mask = white_counts >= HIGH_DENSITY_COUNT
 
     # Find largest rectangular high-density zone (avoiding barriers)
     usable_mask = high_density_mask & ~barrier_grid
 
-    zones = find_density_zones(usable_mask, density_grid, barrier_grid)
+    zones = find_density_zones(usable_mask, white_counts, barrier_grid)
+
+    # Cumulative per-row sums of the cell grids: any strip's total is
+    # cum[y2] - cum[y1], and the overall total is cum[-1]
+    white_cum = np.r_[0, white_counts.sum(axis=1, dtype=np.int64).cumsum()]
+    high_density_cum = np.r_[0, high_density_mask.sum(axis=1).cumsum()]
+    barrier_cum = np.r_[0, barrier_grid.sum(axis=1).cumsum()]
 
     # Horizontal strip analysis (top, middle, bottom thirds)
     third_h = grid_h // 3
-    strips = {
-        'top': {
-            'avg_density': float(np.mean(density_grid[:third_h, :])),
-            'high_density_ratio': float(np.mean(high_density_mask[:third_h, :])),
-            'barrier_ratio': float(np.mean(barrier_grid[:third_h, :]))
-        },
-        'middle': {
-            'avg_density': float(np.mean(density_grid[third_h:2*third_h, :])),
-            'high_density_ratio': float(np.mean(high_density_mask[third_h:2*third_h, :])),
-            'barrier_ratio': float(np.mean(barrier_grid[third_h:2*third_h, :]))
-        },
-        'bottom': {
-            'avg_density': float(np.mean(density_grid[2*third_h:, :])),
-            'high_density_ratio': float(np.mean(high_density_mask[2*third_h:, :])),
-            'barrier_ratio': float(np.mean(barrier_grid[2*third_h:, :]))
-        }
+    strip_bounds = {
+        'top': (0, third_h),
+        'middle': (third_h, 2*third_h),
+        'bottom': (2*third_h, grid_h)
     }
+    strips = {}
+    for name, (y1, y2) in strip_bounds.items():
+        strip_cells = (y2 - y1) * grid_w
+        strips[name] = {
+            'avg_density': float((white_cum[y2] - white_cum[y1]) / (strip_cells * CELL_COUNT)),
+            'high_density_ratio': float((high_density_cum[y2] - high_density_cum[y1]) / strip_cells),
+            'barrier_ratio': float((barrier_cum[y2] - barrier_cum[y1]) / strip_cells)
+        }
 
     # Find best strip for text
-    best_strip = max(strips.items(),
-                     key=lambda x: x[1]['high_density_ratio'] - x[1]['barrier_ratio'])
+    best_strip, best_strip_data = max(strips.items(),
+                                      key=lambda x: x[1]['high_density_ratio'] - x[1]['barrier_ratio'])
+    best_strip_score = best_strip_data['high_density_ratio'] - best_strip_data['barrier_ratio']
 
     # Overall stats
-    overall_density = float(np.mean(density_grid))
-    overall_barrier = float(np.mean(barrier_grid))
+    total_cells = grid_h * grid_w
+    overall_density = float(white_cum[-1] / (total_cells * CELL_COUNT))
+    overall_barrier = float(barrier_cum[-1] / total_cells)
 
     return {
-        'filename': os.path.basename(image_path),
+        'filename': filename,
         'dimensions': {'width': width, 'height': height},
         'grid': {'rows': grid_h, 'cols': grid_w, 'cell_size': CELL_SIZE},
         'overall': {
             'avg_density': round(overall_density, 3),
             'barrier_ratio': round(overall_barrier, 3),
-            'high_density_cells': int(np.sum(high_density_mask)),
-            'total_cells': grid_h * grid_w
+            'high_density_cells': int(high_density_cum[-1]),
+            'total_cells': total_cells
         },
         'strips': strips,
-        'best_strip': best_strip[0],
-        'best_strip_score': round(best_strip[1]['high_density_ratio'] - best_strip[1]['barrier_ratio'], 3),
+        'best_strip': best_strip,
+        'best_strip_score': round(best_strip_score, 3),
         'text_zones': zones,
-        'recommendation': get_recommendation(strips, zones, overall_density)
+        'recommendation': get_recommendation(best_strip, best_strip_score, zones, overall_density)
     }
 
 
-def find_density_zones(usable_mask, density_grid, barrier_grid):
+def find_density_zones(usable_mask, white_counts, barrier_grid):
     """Find rectangular zones suitable for text."""
+    if HAVE_NUMBA:
+        bands = scan_bands(usable_mask.view(np.uint8), white_counts,
+                           MIN_ZONE_CELLS_W, MIN_ZONE_CELLS_H, MAX_ZONE_CELLS_H)
+    else:
+        bands = _scan_bands_numpy(usable_mask, white_counts)
+
+    # Pick the top 5 by area on the candidate array and only build dicts for
+    # those. Ties keep scan order, as a stable sort of all candidates would.
+    areas = bands[:, 2] * bands[:, 3]
+    if len(areas) > MAX_ZONES:
+        kth_area = np.partition(areas, -MAX_ZONES)[-MAX_ZONES]
+        candidates = np.flatnonzero(areas >= kth_area)
+    else:
+        candidates = np.arange(len(areas))
+    top = candidates[np.argsort(-areas[candidates], kind='stable')][:MAX_ZONES]
+
     zones = []
+    for x, y, w, h, white_sum in bands[top].tolist():
+        zones.append({
+            'x': x * CELL_SIZE,
+            'y': y * CELL_SIZE,
+            'width': w * CELL_SIZE,
+            'height': h * CELL_SIZE,
+            'cells': w * h,
+            'area_px': w * h * CELL_SIZE * CELL_SIZE,
+            'avg_density': round(white_sum / (w * h * CELL_COUNT), 3)
+        })
+
+    return zones
+
+
+@njit(cache=True)
+def scan_bands(usable, white_counts, min_w, min_h, max_h):
+    """
+    Find runs of fully usable columns in every horizontal band.
+
+    For each start row the band grows one row at a time, updating a
+    per-column usable flag and white count in place.
+
+    Returns: (N, 5) int64 array of (x, y, width, height, white_count) in cells
+    """
+    grid_h, grid_w = usable.shape
+    n_start = max(grid_h - min_h + 1, 0)
+    max_runs = grid_w // min_w + 1
+    bands = np.empty((n_start * max(max_h - min_h + 1, 0) * max_runs, 5), dtype=np.int64)
+    n = 0
+
+    col_usable = np.empty(grid_w, dtype=np.bool_)
+    col_white = np.empty(grid_w, dtype=np.int64)
+
+    for start_y in range(n_start):
+        col_usable[:] = True
+        col_white[:] = 0
+
+        for end_y in range(start_y + 1, min(start_y + max_h, grid_h) + 1):
+            row = end_y - 1
+            any_usable = False
+            for c in range(grid_w):
+                col_usable[c] = col_usable[c] and usable[row, c] != 0
+                col_white[c] += white_counts[row, c]
+                any_usable = any_usable or col_usable[c]
+
+            # Taller bands from this start row can only lose columns
+            if not any_usable:
+                break
+
+            zone_height = end_y - start_y
+            if zone_height < min_h:
+                continue
+
+            run_start = -1
+            for c in range(grid_w + 1):
+                if c < grid_w and col_usable[c]:
+                    if run_start < 0:
+                        run_start = c
+                elif run_start >= 0:
+                    if c - run_start >= min_w:
+                        white_sum = 0
+                        for k in range(run_start, c):
+                            white_sum += col_white[k]
+                        bands[n, 0] = run_start
+                        bands[n, 1] = start_y
+                        bands[n, 2] = c - run_start
+                        bands[n, 3] = zone_height
+                        bands[n, 4] = white_sum
+                        n += 1
+                    run_start = -1
+
+    return bands[:n]
+
+
+def _scan_bands_numpy(usable_mask, white_counts):
+    """NumPy version of scan_bands, used when Numba is not installed."""
+    bands = []
     grid_h, grid_w = usable_mask.shape
 
-    # Scan for largest rectangles using modified histogram method
-    # First, find runs of usable cells in each row
-    best_zones = []
+    # Rolling vertical minimum per band height: all_usable[h - MIN_ZONE_CELLS_H][y]
+    # flags the columns where usable_mask[y:y+h] is all True
+    all_usable = [
+        ndimage.minimum_filter1d(usable_mask.view(np.uint8), h, axis=0,
+                                 mode='constant', cval=0, origin=-(h // 2)).view(bool)
+        for h in range(MIN_ZONE_CELLS_H, min(MAX_ZONE_CELLS_H, grid_h) + 1)
+    ]
+
+    # Integral image of the white counts, so each band's total is four lookups
+    white_cum2d = np.zeros((grid_h + 1, grid_w + 1), dtype=np.int64)
+    white_cum2d[1:, 1:] = white_counts.cumsum(axis=0, dtype=np.int64).cumsum(axis=1)
 
     # Check horizontal strips at different y positions
     for start_y in range(grid_h - MIN_ZONE_CELLS_H + 1):
-        for end_y in range(start_y + MIN_ZONE_CELLS_H, min(start_y + 20, grid_h + 1)):
-            # Find longest continuous run in this horizontal band
+        for end_y in range(start_y + MIN_ZONE_CELLS_H, min(start_y + MAX_ZONE_CELLS_H, grid_h) + 1):
             zone_height = end_y - start_y
 
             # For each column, check if ALL cells in this band are usable
-            col_usable = np.all(usable_mask[start_y:end_y, :], axis=0)
+            col_usable = all_usable[zone_height - MIN_ZONE_CELLS_H][start_y]
 
             # Find runs of True values
-            runs = find_runs(col_usable)
-
-            for run_start, run_len in runs:
+            for run_start, run_len in find_runs(col_usable):
                 if run_len >= MIN_ZONE_CELLS_W:
-                    area = run_len * zone_height
-                    avg_density = float(np.mean(density_grid[start_y:end_y, run_start:run_start+run_len]))
+                    run_end = run_start + run_len
+                    white_sum = (white_cum2d[end_y, run_end] - white_cum2d[start_y, run_end]
+                                 - white_cum2d[end_y, run_start] + white_cum2d[start_y, run_start])
+                    bands.append((run_start, start_y, run_len, zone_height, white_sum))
 
-                    zones.append({
-                        'x': run_start * CELL_SIZE,
-                        'y': start_y * CELL_SIZE,
-                        'width': run_len * CELL_SIZE,
-                        'height': zone_height * CELL_SIZE,
-                        'cells': run_len * zone_height,
-                        'area_px': run_len * zone_height * CELL_SIZE * CELL_SIZE,
-                        'avg_density': round(avg_density, 3)
-                    })
-
-    # Sort by area and return top 5
-    zones.sort(key=lambda z: z['area_px'], reverse=True)
-    return zones[:5]
+    return np.array(bands, dtype=np.int64).reshape(-1, 5)
 
 
 def find_runs(bool_array):
-    """Find runs of True values in a boolean array."""
-    runs = []
-    in_run = False
-    run_start = 0
-
-    for i, val in enumerate(bool_array):
-        if val and not in_run:
-            in_run = True
-            run_start = i
-        elif not val and in_run:
-            in_run = False
-            runs.append((run_start, i - run_start))
-
-    if in_run:
-        runs.append((run_start, len(bool_array) - run_start))
+    """Find runs of True values in a boolean array.
 
-    return runs
+    Returns a list of (start, length) tuples.
+    """
+    b = np.asarray(bool_array, dtype=np.int8)
 
+    # Pad with zeros so every run has a rising (+1) and falling (-1) edge
+    d = np.diff(np.r_[0, b, 0])
+    starts = np.flatnonzero(d == 1)
+    ends = np.flatnonzero(d == -1)
 
-def get_recommendation(strips, zones, overall_density):
-    """Generate text placement recommendation."""
-    # Find best strip
-    best = max(strips.items(),
-               key=lambda x: x[1]['high_density_ratio'] - x[1]['barrier_ratio'])
+    return list(zip(starts.tolist(), (ends - starts).tolist()))
 
-    strip_name, strip_data = best
-    score = strip_data['high_density_ratio'] - strip_data['barrier_ratio']
 
+def get_recommendation(strip_name, score, zones, overall_density):
+    """Generate text placement recommendation from the already-chosen best strip."""
     if zones and zones[0]['area_px'] > 10000:
         if zones[0]['y'] < 100:
             return 'ZONE_TOP'
@@ -201,18 +318,46 @@ def get_recommendation(strips, zones, overall_density):
         return 'DARK_IMAGE'
 
 
-def analyze_directory(dir_path, pattern='*_dither.png'):
-    """Analyze all images in directory."""
-    results = []
-    dir_path = Path(dir_path)
+def _analyze_paths(img_paths):
+    """Process pool worker: analyze a batch of images, returning (analysis, error) for each.
 
-    for img_path in sorted(dir_path.glob(pattern)):
-        print(f"Analyzing: {img_path.name[:55]}")
+    Clock images share a resolution, so the threshold mask buffer is
+    allocated once per batch and reused while the image shape matches.
+    """
+    outcomes = []
+    masks = None
+
+    for img_path in img_paths:
         try:
-            analysis = analyze_image(img_path)
-            results.append(analysis)
+            pixels = load_grayscale(img_path)
+            if masks is None or masks.shape[1:] != pixels.shape:
+                masks = np.empty((2,) + pixels.shape, dtype=bool)
+            outcomes.append((analyze_pixels(pixels, os.path.basename(img_path), masks), None))
         except Exception as e:
-            print(f"  Error: {e}")
+            outcomes.append((None, str(e)))
+
+    return outcomes
+
+
+def analyze_directory(dir_path, pattern='*_dither.png', max_workers=None):
+    """Analyze all images in directory.
+
+    Images are analyzed in parallel across processes, in batches of
+    BATCH_SIZE per worker call; results keep the sorted file order.
+    """
+    results = []
+    dir_path = Path(dir_path)
+    img_paths = sorted(dir_path.glob(pattern))
+    batches = [img_paths[i:i + BATCH_SIZE] for i in range(0, len(img_paths), BATCH_SIZE)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = itertools.chain.from_iterable(executor.map(_analyze_paths, batches))
+        for img_path, (analysis, error) in zip(img_paths, outcomes):
+            print(f"Analyzing: {img_path.name[:55]}")
+            if error is not None:
+                print(f"  Error: {error}")
+            else:
+                results.append(analysis)
 
     return results
 
@@ -227,43 +372,45 @@ def print_summary(results):
     print(f"{'='*70}")
     print(f"\nTotal images: {len(results)}")
 
-    # Recommendations breakdown
-    recs = {}
-    for r in results:
-        rec = r['recommendation']
-        recs[rec] = recs.get(rec, 0) + 1
+    # Pull the per-image scalars into flat column arrays once; the summary
+    # sorts and counts on these and only indexes results for printing
+    n = len(results)
+    recommendations = np.array([r['recommendation'] for r in results])
+    best_strips = np.array([r['best_strip'] for r in results])
+    densities = np.fromiter((r['overall']['avg_density'] for r in results), float, count=n)
+    zone_areas = np.fromiter((r['text_zones'][0]['area_px'] if r['text_zones'] else 0 for r in results),
+                             int, count=n)
+
+    # Recommendations breakdown (ties keep first-seen order)
+    rec_names, first_seen, rec_counts = np.unique(recommendations, return_index=True, return_counts=True)
+    rec_order = np.lexsort((first_seen, -rec_counts))
 
     print("\nRecommendations:")
-    for rec, count in sorted(recs.items(), key=lambda x: -x[1]):
-        pct = 100 * count / len(results)
-        print(f"  {rec:20} {count:4} ({pct:.1f}%)")
+    for i in rec_order:
+        pct = 100 * rec_counts[i] / n
+        print(f"  {rec_names[i]:20} {rec_counts[i]:4} ({pct:.1f}%)")
 
     # Strip analysis
-    strip_winners = {'top': 0, 'middle': 0, 'bottom': 0}
-    for r in results:
-        strip_winners[r['best_strip']] += 1
+    strip_winners = {strip: int(np.count_nonzero(best_strips == strip))
+                     for strip in ('top', 'middle', 'bottom')}
 
     print("\nBest strip for text:")
     for strip, count in sorted(strip_winners.items(), key=lambda x: -x[1]):
-        print(f"  {strip:10} {count:4} ({100*count/len(results):.1f}%)")
+        print(f"  {strip:10} {count:4} ({100*count/n:.1f}%)")
 
     # Density distribution
-    densities = [r['overall']['avg_density'] for r in results]
     print(f"\nOverall density stats:")
-    print(f"  Min: {min(densities):.2f}")
-    print(f"  Max: {max(densities):.2f}")
-    print(f"  Avg: {np.mean(densities):.2f}")
+    print(f"  Min: {densities.min():.2f}")
+    print(f"  Max: {densities.max():.2f}")
+    print(f"  Avg: {densities.mean():.2f}")
 
     # Show problematic images (low density, high barriers)
     print(f"\n{'='*70}")
     print("IMAGES WITH BEST TEXT ZONES")
     print(f"{'='*70}\n")
 
-    sorted_by_zone = sorted(results,
-                            key=lambda r: r['text_zones'][0]['area_px'] if r['text_zones'] else 0,
-                            reverse=True)
-
-    for r in sorted_by_zone[:15]:
+    for i in np.argsort(-zone_areas, kind='stable')[:15]:
+        r = results[i]
         if r['text_zones']:
             z = r['text_zones'][0]
             print(f"  {r['filename'][:40]:40} {z['width']:3}x{z['height']:<3} @ ({z['x']:3},{z['y']:3}) density={z['avg_density']:.2f}")
@@ -274,8 +421,8 @@ def print_summary(results):
     print("DARKEST IMAGES (may need special handling)")
     print(f"{'='*70}\n")
 
-    sorted_by_density = sorted(results, key=lambda r: r['overall']['avg_density'])
-    for r in sorted_by_density[:15]:
+    for i in np.argsort(densities, kind='stable')[:15]:
+        r = results[i]
         print(f"  {r['filename'][:45]:45} density={r['overall']['avg_density']:.2f} barrier={r['overall']['barrier_ratio']:.2f}")
 
 
@@ -298,6 +445,5 @@ if __name__ == '__main__':
 
     # Save results
     output_path = Path(img_dir) / 'density_analysis.json'
-    with open(output_path, 'w') as f:
-        json.dump(results, f, indent=2)
+    write_json(results, output_path)
     print(f"\nDetailed results saved to: {output_path}")
@@ -8,11 +8,15 @@ Analyzes clock images to:
 """
 
 import os
-import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from PIL import Image
 import numpy as np
 
+from image_io import load_grayscale
+from json_io import write_json
+from pool_worker import catch_errors
+
 # Thresholds for 4-bit grayscale (16 levels)
 # Level 15 = white, Level 0 = black
 WHITE_THRESHOLD = 200  # Pixels above this are "white" (levels 13-15)
@@ -21,35 +25,41 @@ DARK_THRESHOLD = 80    # Pixels below this are "dark" (levels 0-5)
 
 def analyze_image(image_path):
     """Analyze a single image for text placement potential."""
-    img = Image.open(image_path).convert('L')  # Convert to grayscale
-    pixels = np.array(img)
+    pixels = load_grayscale(image_path)
 
-    width, height = img.size
+    height, width = pixels.shape
     total_pixels = width * height
 
     # Overall statistics
     white_pixels = np.sum(pixels >= WHITE_THRESHOLD)
-    light_pixels = np.sum(pixels >= LIGHT_THRESHOLD)
     dark_pixels = np.sum(pixels <= DARK_THRESHOLD)
 
-    # Histogram buckets (simulating 4-bit / 16 levels)
-    hist_16 = np.histogram(pixels, bins=16, range=(0, 256))[0]
+    # Cumulative light pixel count per row: any horizontal strip is two lookups
+    light_cum = np.r_[0, (pixels >= LIGHT_THRESHOLD).sum(axis=1).cumsum()]
+    light_pixels = light_cum[-1]
+
+    # Histogram buckets (simulating 4-bit / 16 levels) - the top nibble is the bucket
+    hist_16 = np.bincount((pixels.ravel() >> 4).astype(np.intp), minlength=16)
 
     # Regional analysis - divide into grid
     grid_rows, grid_cols = 3, 4  # 12 regions
     region_height = height // grid_rows
     region_width = width // grid_cols
 
+    # Crop to whole regions and reduce every region at once
+    cropped = pixels[:grid_rows * region_height, :grid_cols * region_width]
+    tiled = cropped.reshape(grid_rows, region_height, grid_cols, region_width)
+    white_grid = (tiled >= WHITE_THRESHOLD).mean(axis=(1, 3))
+    light_grid = (tiled >= LIGHT_THRESHOLD).mean(axis=(1, 3))
+    mean_grid = tiled.mean(axis=(1, 3))
+
     regions = []
     for row in range(grid_rows):
         for col in range(grid_cols):
-            y1, y2 = row * region_height, (row + 1) * region_height
-            x1, x2 = col * region_width, (col + 1) * region_width
-            region = pixels[y1:y2, x1:x2]
-
-            region_white = np.sum(region >= WHITE_THRESHOLD) / region.size
-            region_light = np.sum(region >= LIGHT_THRESHOLD) / region.size
-            region_mean = np.mean(region)
+            x1, y1 = col * region_width, row * region_height
+            region_white = white_grid[row, col]
+            region_light = light_grid[row, col]
+            region_mean = mean_grid[row, col]
 
             regions.append({
                 'row': row,
@@ -68,11 +78,11 @@ def analyze_image(image_path):
     best_zones = sorted(regions, key=lambda r: r['light_ratio'], reverse=True)
 
     # Top and bottom strips (common text placement)
-    top_strip = pixels[:height//4, :]
-    bottom_strip = pixels[3*height//4:, :]
+    top_end = height // 4
+    bottom_start = 3 * height // 4
 
-    top_light_ratio = np.sum(top_strip >= LIGHT_THRESHOLD) / top_strip.size
-    bottom_light_ratio = np.sum(bottom_strip >= LIGHT_THRESHOLD) / bottom_strip.size
+    top_light_ratio = (light_cum[top_end] - light_cum[0]) / (top_end * width)
+    bottom_light_ratio = (light_cum[height] - light_cum[bottom_start]) / ((height - bottom_start) * width)
 
     return {
         'filename': os.path.basename(image_path),
@@ -105,18 +115,24 @@ def get_recommendation(overall_light, top_light, bottom_light):
     else:
         return 'NEEDS_PROCESSING'
 
-def analyze_directory(dir_path, pattern='*_dither.png'):
-    """Analyze all matching images in a directory."""
+def analyze_directory(dir_path, pattern='*_dither.png', max_workers=None):
+    """Analyze all matching images in a directory.
+
+    Images are analyzed in parallel across processes; results keep the
+    sorted file order.
+    """
     results = []
     dir_path = Path(dir_path)
+    img_paths = sorted(dir_path.glob(pattern))
 
-    for img_path in sorted(dir_path.glob(pattern)):
-        print(f"Analyzing: {img_path.name}")
-        try:
-            analysis = analyze_image(img_path)
-            results.append(analysis)
-        except Exception as e:
-            print(f"  Error: {e}")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = executor.map(catch_errors, repeat(analyze_image), img_paths, chunksize=4)
+        for img_path, (analysis, error) in zip(img_paths, outcomes):
+            print(f"Analyzing: {img_path.name}")
+            if error is not None:
+                print(f"  Error: {error}")
+            else:
+                results.append(analysis)
 
     return results
 
@@ -189,27 +205,8 @@ if __name__ == '__main__':
         }
     }
 
-    # Convert numpy types to native Python for JSON
-    def convert_types(obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, np.bool_):
-            return bool(obj)
-        elif isinstance(obj, dict):
-            return {k: convert_types(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_types(i) for i in obj]
-        return obj
-
-    output = convert_types(output)
-
     output_path = Path(img_dir) / 'image_analysis.json'
-    with open(output_path, 'w') as f:
-        json.dump(output, f, indent=2)
+    write_json(output, output_path)
     print(f"\nDetailed results saved to: {output_path}")
 
     # Print images needing processing with their stats
@@ -12,12 +12,18 @@ Algorithm:
 """
 
 import os
-import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import heapq
 from pathlib import Path
-from PIL import Image
 import numpy as np
 from scipy import ndimage
 
+from image_io import load_grayscale
+from json_io import write_json
+from numba_jit import njit
+from pool_worker import catch_errors
+
 # Thresholds - STRICT settings for clean lineart images
 # New lineart has crisp black lines on pure white - text must NOT intersect black pixels
 PUSH_TO_WHITE_THRESHOLD = 250  # For lineart: only pure white (>=250) is safe
@@ -28,6 +34,7 @@ MIN_TEXT_HEIGHT = 40   # Minimum usable height for text line
 SAFETY_MARGIN_PX = 16  # Pixel margin around black lines (2 cells * 8px)
 
 
+@njit(cache=True)
 def find_largest_white_rectangle(binary_map):
     """
     Find the largest rectangle containing only white (1s) in a binary map.
@@ -35,85 +42,108 @@ def find_largest_white_rectangle(binary_map):
 
     Returns: (x, y, width, height, area)
     """
-    if binary_map.size == 0:
-        return (0, 0, 0, 0, 0)
-
     rows, cols = binary_map.shape
+    best_rect = (0, 0, 0, 0, 0)
+    if rows == 0 or cols == 0:
+        return best_rect
 
-    # Build height map (consecutive 1s above each cell)
-    heights = np.zeros((rows, cols), dtype=int)
-    for i in range(rows):
-        for j in range(cols):
-            if binary_map[i, j] == 1:
-                heights[i, j] = heights[i-1, j] + 1 if i > 0 else 1
-            else:
-                heights[i, j] = 0
+    # Height map row (consecutive 1s above each cell), updated in place per row
+    heights = np.zeros(cols, dtype=np.int64)
+
+    # Monotonic stack of (start, height) pairs for the histogram pass
+    stack_start = np.empty(cols + 1, dtype=np.int64)
+    stack_height = np.empty(cols + 1, dtype=np.int64)
 
     max_area = 0
-    best_rect = (0, 0, 0, 0, 0)
 
-    # For each row, find largest rectangle in histogram
     for i in range(rows):
-        rect = largest_rectangle_in_histogram(heights[i], i)
-        if rect[4] > max_area:
-            max_area = rect[4]
-            best_rect = rect
+        for j in range(cols):
+            if binary_map[i, j] == 1:
+                heights[j] += 1
+            else:
+                heights[j] = 0
+
+        # Largest rectangle in this row's histogram (0 appended to flush stack)
+        top = 0
+        for j in range(cols + 1):
+            h = heights[j] if j < cols else 0
+            start = j
+            while top > 0 and stack_height[top - 1] > h:
+                top -= 1
+                idx = stack_start[top]
+                height = stack_height[top]
+                width = j - idx
+                area = height * width
+                if area > max_area:
+                    max_area = area
+                    # y is i - height + 1 (top of rectangle)
+                    best_rect = (idx, i - height + 1, width, height, area)
+                start = idx
+            stack_start[top] = start
+            stack_height[top] = h
+            top += 1
 
     return best_rect
 
 
-def largest_rectangle_in_histogram(heights, row_idx):
+def _region_rect_entry(sub_map, slc, region_id):
     """
-    Find largest rectangle in histogram (standard algorithm).
-    Returns: (x, y, width, height, area)
+    Find the largest rectangle in one region's bounding box as a heap entry.
+    Ties order by bottom row then right edge, matching a full-map search.
     """
-    stack = []
-    max_area = 0
-    best_rect = (0, 0, 0, 0, 0)
+    x, y, w, h, area = find_largest_white_rectangle(sub_map)
+    x, y = int(x) + slc[1].start, int(y) + slc[0].start
+    return (-int(area), y + int(h) - 1, x + int(w), region_id, (x, y, int(w), int(h), int(area)))
 
-    heights = list(heights) + [0]  # Append 0 to flush stack
-
-    for i, h in enumerate(heights):
-        start = i
-        while stack and stack[-1][1] > h:
-            idx, height = stack.pop()
-            width = i - idx
-            area = height * width
-            if area > max_area:
-                max_area = area
-                # y is row_idx - height + 1 (top of rectangle)
-                best_rect = (idx, row_idx - height + 1, width, height, area)
-            start = idx
-        stack.append((start, h))
 
-    return best_rect
-
-
-def find_top_n_rectangles(binary_map, n=5, min_width=MIN_TEXT_WIDTH, min_height=MIN_TEXT_HEIGHT):
+def find_top_n_rectangles(binary_map, n=5, min_width=MIN_TEXT_WIDTH, min_height=MIN_TEXT_HEIGHT,
+                          labeled=None):
     """
     Find the top N largest white rectangles.
     Uses iterative approach: find largest, mark as used, repeat.
+
+    A white rectangle never spans two contiguous regions, so each region is
+    searched once within its bounding box, and only the region a rectangle
+    was taken from is searched again.
     """
+    if binary_map.size == 0:
+        return []
+
+    if labeled is None:
+        labeled, _ = ndimage.label(binary_map)
+
+    heap = []
+    sub_maps = {}
+    for region_id, slc in enumerate(ndimage.find_objects(labeled), start=1):
+        if slc is None:
+            continue
+        sub_map = (labeled[slc] == region_id).view(np.uint8)
+        sub_maps[region_id] = (slc, sub_map)
+        heap.append(_region_rect_entry(sub_map, slc, region_id))
+    heapq.heapify(heap)
+
     rectangles = []
-    work_map = binary_map.copy()
 
-    for _ in range(n):
-        rect = find_largest_white_rectangle(work_map)
+    while heap and len(rectangles) < n:
+        _, _, _, region_id, rect = heapq.heappop(heap)
         x, y, w, h, area = rect
 
         if w < min_width or h < min_height or area == 0:
             break
 
         rectangles.append({
-            'x': int(x),
-            'y': int(y),
-            'width': int(w),
-            'height': int(h),
-            'area': int(area)
+            'x': x,
+            'y': y,
+            'width': w,
+            'height': h,
+            'area': area
         })
 
-        # Mark this rectangle as used (set to 0)
-        work_map[y:y+h, x:x+w] = 0
+        # Mark this rectangle as used (set to 0) and search its region again
+        slc, sub_map = sub_maps[region_id]
+        y0, x0 = y - slc[0].start, x - slc[1].start
+        sub_map[y0:y0+h, x0:x0+w] = 0
+        heapq.heappush(heap, _region_rect_entry(sub_map, slc, region_id))
 
     return rectangles
 
@@ -126,47 +156,42 @@ def analyze_image(image_path, push_threshold=PUSH_TO_WHITE_THRESHOLD,
     For lineart images: finds zones that are completely white with NO black pixels.
     Uses safety margin to keep text away from line edges.
     """
-    img = Image.open(image_path).convert('L')
-    pixels = np.array(img)
+    pixels = load_grayscale(image_path)
 
-    width, height = img.size
+    height, width = pixels.shape
 
     # Step 1: For lineart, we don't "push" - we need strict white detection
-    # Only pixels >= push_threshold are considered white
-    pushed = pixels.copy()
+    # Only pixels >= push_threshold are considered white; ANY dark pixel is a barrier
+    barrier_mask = (pixels <= barrier_threshold)
 
-    # Step 2: Create binary map (1 = white/safe, 0 = barrier/unsafe)
-    # For lineart: ANY dark pixel is a barrier
-    binary_map = np.zeros_like(pushed, dtype=np.uint8)
-    binary_map[pixels >= push_threshold] = 1  # Pure white = safe
-    binary_map[pixels <= barrier_threshold] = 0  # Any dark pixel = barrier
-
-    # Step 2.5: Apply safety margin - dilate barriers to keep text away from edges
+    # Step 2: Apply safety margin - dilate barriers to keep text away from edges
     if SAFETY_MARGIN_PX > 0:
-        barrier_mask = (pixels <= barrier_threshold)
-        # Dilate barrier mask
+        # A square dilation is separable: a max filter runs it as a row pass then a column pass
         struct_size = SAFETY_MARGIN_PX * 2 + 1
-        struct = np.ones((struct_size, struct_size))
-        expanded_barriers = ndimage.binary_dilation(barrier_mask, structure=struct)
-        binary_map[expanded_barriers] = 0
+        expanded_barriers = ndimage.maximum_filter(
+            barrier_mask.view(np.uint8), size=struct_size, mode='constant', cval=0
+        ).view(bool)
+    else:
+        expanded_barriers = barrier_mask
+
+    # Step 2.5: Create binary map (1 = white/safe, 0 = barrier/unsafe) in one pass
+    binary_map = ((pixels >= push_threshold) & ~expanded_barriers).view(np.uint8)
 
     # Step 3: Find contiguous white regions
     labeled, num_features = ndimage.label(binary_map)
 
-    # Get stats for each region
+    # Get stats for each region - bounding boxes and pixel counts in one pass each
+    slices = ndimage.find_objects(labeled)
+    sizes = ndimage.sum_labels(binary_map, labeled, index=np.arange(1, num_features + 1))
+
     regions = []
-    for region_id in range(1, num_features + 1):
-        region_mask = (labeled == region_id)
-        region_size = np.sum(region_mask)
-
-        # Get bounding box
-        rows = np.any(region_mask, axis=1)
-        cols = np.any(region_mask, axis=0)
-        if not np.any(rows) or not np.any(cols):
+    for region_id, (slc, region_size) in enumerate(zip(slices, sizes), start=1):
+        if slc is None:
             continue
 
-        rmin, rmax = np.where(rows)[0][[0, -1]]
-        cmin, cmax = np.where(cols)[0][[0, -1]]
+        rmin, cmin = slc[0].start, slc[1].start
+        region_h = slc[0].stop - rmin
+        region_w = slc[1].stop - cmin
 
         regions.append({
             'id': region_id,
@@ -174,21 +199,21 @@ def analyze_image(image_path, push_threshold=PUSH_TO_WHITE_THRESHOLD,
             'bbox': {
                 'x': int(cmin),
                 'y': int(rmin),
-                'width': int(cmax - cmin + 1),
-                'height': int(rmax - rmin + 1)
+                'width': int(region_w),
+                'height': int(region_h)
             },
-            'fill_ratio': round(region_size / ((cmax - cmin + 1) * (rmax - rmin + 1)), 3)
+            'fill_ratio': round(region_size / (region_w * region_h), 3)
         })
 
     # Sort by pixel count
     regions = sorted(regions, key=lambda r: r['pixel_count'], reverse=True)
 
     # Step 4: Find largest rectangles for text
-    text_zones = find_top_n_rectangles(binary_map, n=5)
+    text_zones = find_top_n_rectangles(binary_map, n=5, labeled=labeled)
 
     # Step 5: Calculate overall stats
-    total_white = np.sum(binary_map == 1)
-    total_barrier = np.sum(pixels <= barrier_threshold)
+    total_white = np.count_nonzero(binary_map)
+    total_barrier = np.count_nonzero(barrier_mask)
 
     # Identify best text placement strategy
     if text_zones:
@@ -222,18 +247,24 @@ def analyze_image(image_path, push_threshold=PUSH_TO_WHITE_THRESHOLD,
     }
 
 
-def analyze_directory(dir_path, pattern='*_dither.png'):
-    """Analyze all images in directory."""
+def analyze_directory(dir_path, pattern='*_dither.png', max_workers=None):
+    """Analyze all images in directory.
+
+    Images are analyzed in parallel across processes; results keep the
+    sorted file order.
+    """
     results = []
     dir_path = Path(dir_path)
-
-    for img_path in sorted(dir_path.glob(pattern)):
-        print(f"Analyzing: {img_path.name[:60]}")
-        try:
-            analysis = analyze_image(img_path)
-            results.append(analysis)
-        except Exception as e:
-            print(f"  Error: {e}")
+    img_paths = sorted(dir_path.glob(pattern))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = executor.map(catch_errors, repeat(analyze_image), img_paths, chunksize=4)
+        for img_path, (analysis, error) in zip(img_paths, outcomes):
+            print(f"Analyzing: {img_path.name[:60]}")
+            if error is not None:
+                print(f"  Error: {error}")
+            else:
+                results.append(analysis)
 
     return results
 
@@ -311,6 +342,5 @@ if __name__ == '__main__':
 
     # Save results
     output_path = Path(img_dir) / 'whitespace_analysis.json'
-    with open(output_path, 'w') as f:
-        json.dump(results, f, indent=2)
+    write_json(results, output_path)
     print(f"\nDetailed results saved to: {output_path}")
@@ -6,49 +6,78 @@ Device needs: Actual PNG, 510x300, small file size
 """
 
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from PIL import Image
 
+from image_io import save_png
+
 lineart_dir = os.path.join(os.path.dirname(__file__), 'lineart')
 output_dir = os.path.join(os.path.dirname(__file__), 'lineart-device')
 
-# Create output directory
-os.makedirs(output_dir, exist_ok=True)
-
-# Get all lineart files
-files = [f for f in os.listdir(lineart_dir) if f.endswith('_lineart.png')]
-files.sort()
-
-print(f"Converting {len(files)} lineart images to device format...")
-print("Target: PNG, 510x300, grayscale\n")
+DEVICE_SIZE = (510, 300)
 
-success = 0
-failed = 0
 
-for i, file in enumerate(files):
+def _convert_one(file, fast=False, skip_unchanged=False):
+    """Process pool worker: convert one file, returning (size_kb, error)."""
     input_path = os.path.join(lineart_dir, file)
     output_path = os.path.join(output_dir, file)
 
-    short_name = file[:50] + "..." if len(file) > 50 else file
-    print(f"[{i+1}/{len(files)}] {short_name}", end=" ")
-
     try:
         img = Image.open(input_path)
+        # JPEG payloads decode straight to grayscale at a reduced DCT scale
+        img.draft('L', DEVICE_SIZE)
         # Convert to grayscale
-        img = img.convert('L')
-        # Resize to device dimensions
-        img = img.resize((510, 300), Image.LANCZOS)
+        if img.mode != 'L':
+            img = img.convert('L')
+        # Box-decimate anything still 2x+ too large, then bilinear to device dimensions
+        factor = min(img.width // DEVICE_SIZE[0], img.height // DEVICE_SIZE[1])
+        if factor > 1:
+            img = img.reduce(factor)
+        img = img.resize(DEVICE_SIZE, Image.BILINEAR)
         # Save as proper PNG
-        img.save(output_path, 'PNG', optimize=True)
+        size = save_png(img, output_path, fast=fast, skip_unchanged=skip_unchanged)
 
         # Report size
-        size_kb = os.path.getsize(output_path) / 1024
-        print(f"-> {size_kb:.1f}KB")
-        success += 1
+        return size / 1024, None
     except Exception as e:
-        print(f"FAILED: {e}")
-        failed += 1
+        return None, str(e)
+
+
+if __name__ == '__main__':
+    fast = '--fast' in sys.argv
+    skip_unchanged = '--skip-unchanged' in sys.argv
+
+    # Create output directory
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Get all lineart files
+    files = [f for f in os.listdir(lineart_dir) if f.endswith('_lineart.png')]
+    files.sort()
+
+    print(f"Converting {len(files)} lineart images to device format...")
+    print(f"Target: PNG, {DEVICE_SIZE[0]}x{DEVICE_SIZE[1]}, grayscale\n")
+
+    success = 0
+    failed = 0
+
+    # Convert in parallel; results come back in file order for printing
+    with ProcessPoolExecutor() as executor:
+        outcomes = executor.map(_convert_one, files, repeat(fast),
+                                repeat(skip_unchanged), chunksize=4)
+        for i, (file, (size_kb, error)) in enumerate(zip(files, outcomes)):
+            short_name = file[:50] + "..." if len(file) > 50 else file
+            print(f"[{i+1}/{len(files)}] {short_name}", end=" ")
+
+            if error is not None:
+                print(f"FAILED: {error}")
+                failed += 1
+            else:
+                print(f"-> {size_kb:.1f}KB")
+                success += 1
 
-print(f"\n=== Conversion Complete ===")
-print(f"Success: {success}/{len(files)}")
-print(f"Failed: {failed}/{len(files)}")
-print(f"\nOutput directory: {output_dir}")
+    print(f"\n=== Conversion Complete ===")
+    print(f"Success: {success}/{len(files)}")
+    print(f"Failed: {failed}/{len(files)}")
+    print(f"\nOutput directory: {output_dir}")
@@ -4,34 +4,40 @@ Convert Dithered Images to Solid Black & White
 Applies blur to merge dither dots, then thresholds to get solid B&W regions.
 """
 
-import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from PIL import Image, ImageFilter
-import numpy as np
+from PIL import Image
+from scipy import ndimage
 
+from image_io import load_grayscale, save_png
 
-def convert_to_solid_bw(image_path, output_path, blur_radius=2, threshold=128):
+
+def convert_to_solid_bw(image_path, output_path, blur_radius=2, threshold=128,
+                        fast=False, skip_unchanged=False):
     """Convert dithered image to solid B&W by blurring then thresholding."""
-    img = Image.open(image_path).convert('L')
+    pixels = load_grayscale(image_path)
 
-    # Blur to merge dither dots into solid regions
-    blurred = img.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+    # Blur to merge dither dots into solid regions - a single box pass is
+    # enough for thresholding, no need for a true Gaussian
+    size = int(2 * blur_radius + 1)
+    pixels = ndimage.uniform_filter(pixels, size=size)
 
     # Threshold to pure black/white
-    pixels = np.array(blurred)
-    bw_pixels = (pixels > threshold).astype(np.uint8) * 255
+    bw_mask = pixels > threshold
 
-    # Create output
-    bw_img = Image.fromarray(bw_pixels, mode='L')
-    bw_img = bw_img.convert('1')  # 1-bit for smallest size
-    bw_img.save(output_path, 'PNG', optimize=True)
+    # Create output - a bool array maps straight to 1-bit for smallest size
+    bw_img = Image.fromarray(bw_mask)
+    return save_png(bw_img, output_path, fast=fast, skip_unchanged=skip_unchanged)
 
-    return os.path.getsize(output_path)
 
+def process_directory(input_dir, output_dir, blur_radius=2, threshold=128,
+                      fast=False, skip_unchanged=False, max_workers=None):
+    """Process all dithered images.
 
-def process_directory(input_dir, output_dir, blur_radius=2, threshold=128):
-    """Process all dithered images."""
+    Images are converted in parallel across processes.
+    """
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -41,24 +47,29 @@ def process_directory(input_dir, output_dir, blur_radius=2, threshold=128):
     print(f"Blur radius: {blur_radius}, Threshold: {threshold}")
     print(f"Output: {output_dir}\n")
 
-    total_size = 0
-    for i, img_path in enumerate(images):
-        out_name = img_path.name.replace('_dither', '_solid')
-        out_path = output_dir / out_name
+    out_paths = [output_dir / img_path.name.replace('_dither', '_solid') for img_path in images]
 
-        size = convert_to_solid_bw(img_path, out_path, blur_radius, threshold)
-        total_size += size
+    total_size = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        sizes = executor.map(convert_to_solid_bw, images, out_paths,
+                             repeat(blur_radius), repeat(threshold),
+                             repeat(fast), repeat(skip_unchanged), chunksize=4)
+        for i, size in enumerate(sizes):
+            total_size += size
 
-        if (i + 1) % 30 == 0:
-            print(f"  {i + 1}/{len(images)}...")
+            if (i + 1) % 30 == 0:
+                print(f"  {i + 1}/{len(images)}...")
 
     print(f"\nDone! Total: {total_size/1024/1024:.1f} MB")
 
-
 if __name__ == '__main__':
-    input_dir = sys.argv[1] if len(sys.argv) > 1 else '../croppedimages'
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else './solid_bw'
-    blur = float(sys.argv[3]) if len(sys.argv) > 3 else 2
-    thresh = int(sys.argv[4]) if len(sys.argv) > 4 else 128
+    fast = '--fast' in sys.argv
+    skip_unchanged = '--skip-unchanged' in sys.argv
+    args = [a for a in sys.argv[1:] if a not in ('--fast', '--skip-unchanged')]
+
+    input_dir = args[0] if len(args) > 0 else '../croppedimages'
+    output_dir = args[1] if len(args) > 1 else './solid_bw'
+    blur = float(args[2]) if len(args) > 2 else 2
+    thresh = int(args[3]) if len(args) > 3 else 128
 
-    process_directory(input_dir, output_dir, blur, thresh)
+    process_directory(input_dir, output_dir, blur, thresh, fast, skip_unchanged)
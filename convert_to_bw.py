@@ -7,10 +7,15 @@ using adaptive thresholding for best results across varying images.
 
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
 from pathlib import Path
 from PIL import Image
 import numpy as np
 
+from image_io import load_grayscale, save_png
+from numba_jit import HAVE_NUMBA, njit
+
 # Threshold methods
 THRESHOLD_OTSU = 'otsu'      # Automatic optimal threshold per image
 THRESHOLD_FIXED = 'fixed'    # Fixed threshold (e.g., 128)
@@ -19,69 +24,146 @@ THRESHOLD_MEAN = 'mean'      # Use image mean as threshold
 DEFAULT_METHOD = THRESHOLD_OTSU
 FIXED_THRESHOLD = 128
 
+# Images handed to each process pool worker call; buffers are reused within a batch
+BATCH_SIZE = 8
 
-def otsu_threshold(pixels):
-    """Calculate Otsu's optimal threshold."""
-    hist, _ = np.histogram(pixels.flatten(), bins=256, range=(0, 256))
-    total = pixels.size
+# Gray levels 0-255, shared by every otsu_threshold call
+_LEVELS = np.arange(256, dtype=np.int64)
 
-    sum_total = np.sum(np.arange(256) * hist)
-    sum_bg = 0
-    weight_bg = 0
 
-    max_variance = 0
-    threshold = 0
+@njit(cache=True)
+def _otsu_search(hist, total):
+    """Scan all 256 thresholds for the maximum between-class variance."""
+    sum_total = 0
+    for t in range(256):
+        sum_total += t * hist[t]
 
+    best_threshold = 0
+    best_variance = -1.0
+    weight_bg = 0
+    sum_bg = 0
     for t in range(256):
         weight_bg += hist[t]
-        if weight_bg == 0:
-            continue
-
+        sum_bg += t * hist[t]
         weight_fg = total - weight_bg
-        if weight_fg == 0:
-            break
+        # Thresholds that leave either class empty are not candidates
+        if weight_bg == 0 or weight_fg == 0:
+            continue
 
-        sum_bg += t * hist[t]
         mean_bg = sum_bg / weight_bg
         mean_fg = (sum_total - sum_bg) / weight_fg
-
         variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = t
+
+    return best_threshold
+
+
+def otsu_threshold(pixels, scratch=None):
+    """Calculate Otsu's optimal threshold.
+
+    scratch is an optional (5, 256) float64 buffer for the NumPy search, so
+    batches of images can run it without allocating per call.
+    """
+    # pixels is uint8, so a direct tally per level is the 256-bin histogram
+    hist = np.bincount(pixels.ravel(), minlength=256)
+    total = pixels.size
 
-        if variance > max_variance:
-            max_variance = variance
-            threshold = t
+    if HAVE_NUMBA:
+        return int(_otsu_search(hist, total))
 
-    return threshold
+    if scratch is None:
+        scratch = np.empty((5, 256))
+    weight_bg, weight_fg, sum_bg, mean_fg, variance = scratch
 
+    # Class weights and intensity sums for every candidate threshold at once
+    # (counts stay far below 2**53, so float64 holds them exactly)
+    np.cumsum(hist, out=weight_bg)
+    np.subtract(total, weight_bg, out=weight_fg)
+    np.multiply(_LEVELS, hist, out=sum_bg)
+    np.cumsum(sum_bg, out=sum_bg)
+    sum_total = sum_bg[-1]
 
-def convert_to_bw(image_path, output_path, method=DEFAULT_METHOD):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # variance holds mean_bg until the final product
+        np.divide(sum_bg, weight_bg, out=variance)
+        np.subtract(sum_total, sum_bg, out=mean_fg)
+        np.divide(mean_fg, weight_fg, out=mean_fg)
+        np.subtract(variance, mean_fg, out=variance)
+        np.square(variance, out=variance)
+        np.multiply(weight_bg, weight_fg, out=mean_fg)
+        np.multiply(mean_fg, variance, out=variance)
+
+    # Thresholds that leave either class empty are not candidates
+    variance[(weight_bg == 0) | (weight_fg == 0)] = -1
+
+    return int(np.argmax(variance))
+
+
+def convert_to_bw(image_path, output_path, method=DEFAULT_METHOD, fast=False):
     """Convert image to pure black and white."""
-    img = Image.open(image_path).convert('L')
-    pixels = np.array(img)
+    return convert_pixels(load_grayscale(image_path), output_path, method, fast)
+
 
+def convert_pixels(pixels, output_path, method=DEFAULT_METHOD, fast=False,
+                   mask=None, otsu_scratch=None, skip_unchanged=False):
+    """Threshold a grayscale pixel array and save it as a 1-bit PNG.
+
+    mask is an optional bool buffer of the image shape and otsu_scratch an
+    optional Otsu scratch buffer, so batches of same-sized images can reuse them.
+    """
     # Determine threshold
     if method == THRESHOLD_OTSU:
-        threshold = otsu_threshold(pixels)
+        threshold = otsu_threshold(pixels, otsu_scratch)
     elif method == THRESHOLD_MEAN:
         threshold = int(np.mean(pixels))
     else:
         threshold = FIXED_THRESHOLD
 
     # Apply threshold
-    bw_pixels = (pixels > threshold).astype(np.uint8) * 255
+    bw_mask = np.greater(pixels, threshold, out=mask)
+
+    # Create output image - a bool array maps straight to 1-bit mode,
+    # which minimizes file size
+    bw_img = Image.fromarray(bw_mask)
+    return threshold, save_png(bw_img, output_path, fast=fast,
+                               skip_unchanged=skip_unchanged)
 
-    # Create output image
-    bw_img = Image.fromarray(bw_pixels, mode='L')
 
-    # Save as 1-bit to minimize file size
-    bw_img = bw_img.convert('1')
-    bw_img.save(output_path, 'PNG', optimize=True)
+def _convert_paths(jobs, method, fast, skip_unchanged=False):
+    """Process pool worker: convert a batch of (input, output) paths,
+    returning (threshold, size, error) for each.
 
-    return threshold, os.path.getsize(output_path)
+    Clock images share a resolution, so the threshold mask and the Otsu
+    scratch buffer are allocated once per batch and reused while the image
+    shape matches.
+    """
+    outcomes = []
+    mask = None
+    otsu_scratch = np.empty((5, 256))
 
+    for image_path, output_path in jobs:
+        try:
+            pixels = load_grayscale(image_path)
+            if mask is None or mask.shape != pixels.shape:
+                mask = np.empty(pixels.shape, dtype=bool)
+            threshold, new_size = convert_pixels(pixels, output_path, method, fast,
+                                                 mask, otsu_scratch, skip_unchanged)
+            outcomes.append((threshold, new_size, None))
+        except Exception as e:
+            outcomes.append((None, None, str(e)))
 
-def process_directory(input_dir, output_dir, pattern='*_dither.png', method=DEFAULT_METHOD):
-    """Process all images in directory."""
+    return outcomes
+
+
+def process_directory(input_dir, output_dir, pattern='*_dither.png', method=DEFAULT_METHOD,
+                      fast=False, skip_unchanged=False, max_workers=None):
+    """Process all images in directory.
+
+    Images are converted in parallel across processes, in batches of
+    BATCH_SIZE per worker call; results keep the sorted file order.
+    """
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -95,16 +177,24 @@ def process_directory(input_dir, output_dir, pattern='*_dither.png', method=DEFA
     total_original = 0
     total_converted = 0
 
-    for i, img_path in enumerate(images):
-        # Output filename: replace _dither with _bw
-        out_name = img_path.name.replace('_dither', '_bw')
-        out_path = output_dir / out_name
+    # Output filename: replace _dither with _bw
+    out_names = [img_path.name.replace('_dither', '_bw') for img_path in images]
+    jobs = [(img_path, output_dir / out_name) for img_path, out_name in zip(images, out_names)]
+    batches = [jobs[i:i + BATCH_SIZE] for i in range(0, len(jobs), BATCH_SIZE)]
 
-        original_size = os.path.getsize(img_path)
-        total_original += original_size
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = chain.from_iterable(
+            executor.map(_convert_paths, batches, repeat(method), repeat(fast),
+                         repeat(skip_unchanged)))
+        for i, (img_path, out_name, (threshold, new_size, error)) in enumerate(
+                zip(images, out_names, outcomes)):
+            original_size = os.path.getsize(img_path)
+            total_original += original_size
+
+            if error is not None:
+                print(f"  Error processing {img_path.name}: {error}")
+                continue
 
-        try:
-            threshold, new_size = convert_to_bw(img_path, out_path, method)
             total_converted += new_size
 
             reduction = (1 - new_size / original_size) * 100
@@ -119,9 +209,6 @@ def process_directory(input_dir, output_dir, pattern='*_dither.png', method=DEFA
             if (i + 1) % 20 == 0:
                 print(f"  Processed {i + 1}/{len(images)}...")
 
-        except Exception as e:
-            print(f"  Error processing {img_path.name}: {e}")
-
     # Summary
     print(f"\n{'='*60}")
     print("CONVERSION SUMMARY")
@@ -142,12 +229,16 @@ def process_directory(input_dir, output_dir, pattern='*_dither.png', method=DEFA
 
 
 if __name__ == '__main__':
-    input_dir = sys.argv[1] if len(sys.argv) > 1 else '../croppedimages'
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else './bw_images'
-    method = sys.argv[3] if len(sys.argv) > 3 else THRESHOLD_OTSU
+    fast = '--fast' in sys.argv
+    skip_unchanged = '--skip-unchanged' in sys.argv
+    args = [a for a in sys.argv[1:] if a not in ('--fast', '--skip-unchanged')]
+
+    input_dir = args[0] if len(args) > 0 else '../croppedimages'
+    output_dir = args[1] if len(args) > 1 else './bw_images'
+    method = args[2] if len(args) > 2 else THRESHOLD_OTSU
 
     print(f"\n{'='*60}")
     print("LIVING CLOCK - BLACK & WHITE CONVERSION")
     print(f"{'='*60}\n")
 
-    process_directory(input_dir, output_dir, '*_dither.png', method)
+    process_directory(input_dir, output_dir, '*_dither.png', method, fast, skip_unchanged)
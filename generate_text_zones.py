@@ -8,11 +8,16 @@ Output: text-zones.json
 """
 
 import os
-import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from PIL import Image
 import numpy as np
 
+from json_io import write_json
+from numba_jit import HAVE_NUMBA, njit
+from pool_worker import catch_errors
+
 # Analysis parameters - STRICT settings for clean lineart images
 # New lineart has crisp black lines on pure white - text must NOT intersect black pixels
 CELL_SIZE = 8
@@ -24,6 +29,27 @@ SAFETY_MARGIN = 2           # Extra cells of margin around black pixels
 MIN_ZONE_WIDTH = 120
 MIN_ZONE_HEIGHT = 40
 
+# Point lookup tables that mark white / black pixels as 255 before the
+# CELL_SIZE box reduction; a reduced pixel is then 255 * count / cells
+_WHITE_LUT = [255 if v >= WHITE_THRESHOLD else 0 for v in range(256)]
+_BLACK_LUT = [255 if v <= BLACK_THRESHOLD else 0 for v in range(256)]
+
+
+@njit(cache=True)
+def _cell_counts(pixels, grid_h, grid_w):
+    """Count white and black pixels in every CELL_SIZE x CELL_SIZE cell in one pass."""
+    white_counts = np.zeros((grid_h, grid_w), dtype=np.int64)
+    black_counts = np.zeros((grid_h, grid_w), dtype=np.int64)
+    for y in range(grid_h * CELL_SIZE):
+        cy = y // CELL_SIZE
+        for x in range(grid_w * CELL_SIZE):
+            v = pixels[y, x]
+            if v >= WHITE_THRESHOLD:
+                white_counts[cy, x // CELL_SIZE] += 1
+            if v <= BLACK_THRESHOLD:
+                black_counts[cy, x // CELL_SIZE] += 1
+    return white_counts, black_counts
+
 
 def analyze_image_for_text_zone(image_path):
     """Analyze image and return best text zone.
@@ -31,42 +57,47 @@ def analyze_image_for_text_zone(image_path):
     For lineart images: finds zones that are completely white with NO black pixels.
     Uses safety margin to keep text away from line edges.
     """
-    img = Image.open(image_path).convert('L')
-    pixels = np.array(img)
-    height, width = pixels.shape
+    img = Image.open(image_path)
+    if img.mode != 'L':
+        img = img.convert('L')
+    width, height = img.size
 
     grid_h = height // CELL_SIZE
     grid_w = width // CELL_SIZE
 
     # Build density grid - for lineart, we need STRICT white detection
     # A cell is only usable if it has essentially NO black pixels
-    density_grid = np.zeros((grid_h, grid_w))
-    barrier_grid = np.zeros((grid_h, grid_w), dtype=bool)  # Track cells with ANY black
-
-    for gy in range(grid_h):
-        for gx in range(grid_w):
-            y1, y2 = gy * CELL_SIZE, (gy + 1) * CELL_SIZE
-            x1, x2 = gx * CELL_SIZE, (gx + 1) * CELL_SIZE
-            cell = pixels[y1:y2, x1:x2]
-            white_count = np.sum(cell >= WHITE_THRESHOLD)
-            black_count = np.sum(cell <= BLACK_THRESHOLD)
-            total = cell.size
-
-            # For lineart: ANY black pixel makes this cell a barrier
-            black_ratio = black_count / total
-            if black_ratio > BLACK_TOLERANCE:
-                density_grid[gy, gx] = 0
-                barrier_grid[gy, gx] = True
-            else:
-                density_grid[gy, gx] = white_count / total
+    total = CELL_SIZE * CELL_SIZE
+    if HAVE_NUMBA:
+        white_counts, black_counts = _cell_counts(np.asarray(img), grid_h, grid_w)
+    elif grid_h == 0 or grid_w == 0:
+        # Smaller than one cell - reduce() rejects an empty box
+        white_counts = black_counts = np.zeros((grid_h, grid_w))
+    else:
+        # Threshold, then box-reduce whole cells so each cell becomes one pixel;
+        # rounding recovers the exact per-cell counts (for CELL_SIZE up to 15)
+        box = (0, 0, grid_w * CELL_SIZE, grid_h * CELL_SIZE)
+        white_cells = np.asarray(img.point(_WHITE_LUT).reduce(CELL_SIZE, box=box))
+        black_cells = np.asarray(img.point(_BLACK_LUT).reduce(CELL_SIZE, box=box))
+        white_counts = np.rint(white_cells * (total / 255))
+        black_counts = np.rint(black_cells * (total / 255))
+
+    # For lineart: ANY black pixel makes this cell a barrier
+    black_ratio = black_counts / total
+    barrier_grid = black_ratio > BLACK_TOLERANCE  # Track cells with ANY black
+    density_grid = np.where(barrier_grid, 0.0, white_counts / total)
 
     # Apply safety margin - expand barrier zones by SAFETY_MARGIN cells
     # This keeps text away from the edges of black lines
-    from scipy import ndimage
     if SAFETY_MARGIN > 0:
-        # Dilate barrier grid to create margin
-        struct = np.ones((SAFETY_MARGIN * 2 + 1, SAFETY_MARGIN * 2 + 1))
-        expanded_barriers = ndimage.binary_dilation(barrier_grid, structure=struct)
+        # Dilate barrier grid to create margin: a cell is within the margin if
+        # its (2m+1)^2 window holds any barrier, counted from an integral image
+        k = SAFETY_MARGIN * 2 + 1
+        padded = np.pad(barrier_grid, SAFETY_MARGIN).astype(np.int32)
+        ii = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.int32)
+        ii[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+        window = ii[k:, k:] - ii[:-k, k:] - ii[k:, :-k] + ii[:-k, :-k]
+        expanded_barriers = window > 0
         # Zero out density where barriers expanded
         density_grid[expanded_barriers] = 0
 
@@ -95,59 +126,79 @@ def analyze_image_for_text_zone(image_path):
 
 
 def find_best_zone(mask, density_grid):
-    """Find best zone for text - maximize area for poem display."""
+    """Find best zone for text - maximize area for poem display.
+
+    Runs the histogram/monotonic-stack largest-rectangle scan once per row,
+    with each row as the zone bottom. Ties keep the topmost, then shortest,
+    then leftmost zone.
+    """
     grid_h, grid_w = mask.shape
     min_cells_w = MIN_ZONE_WIDTH // CELL_SIZE
     min_cells_h = MIN_ZONE_HEIGHT // CELL_SIZE
 
-    best_zone = None
-    best_score = 0
-
-    for start_y in range(grid_h - min_cells_h + 1):
-        for end_y in range(start_y + min_cells_h, grid_h + 1):
-            zone_height = end_y - start_y
-            col_usable = np.all(mask[start_y:end_y, :], axis=0)
-
-            # Find runs of usable columns
-            run_start = None
-            for i in range(len(col_usable) + 1):
-                if i < len(col_usable) and col_usable[i]:
-                    if run_start is None:
-                        run_start = i
-                else:
-                    if run_start is not None:
-                        run_len = i - run_start
-                        if run_len >= min_cells_w:
-                            width_px = run_len * CELL_SIZE
-                            height_px = zone_height * CELL_SIZE
-                            area = width_px * height_px
-
-                            # Score: use area (width * height) for balanced zones
-                            # Poems need both width for text AND height for multiple lines
-                            # Add small bonus for width to break ties
-                            score = area + (width_px // 10)
-
-                            # Only consider zones with reasonable minimum height (60px)
-                            if height_px >= 60 and score > best_score:
-                                best_score = score
-                                avg_density = float(np.mean(
-                                    density_grid[start_y:end_y, run_start:run_start+run_len]
-                                ))
-                                best_zone = {
-                                    'x': run_start * CELL_SIZE,
-                                    'y': start_y * CELL_SIZE,
-                                    'width': width_px,
-                                    'height': height_px,
-                                    'area': area,
-                                    'density': round(avg_density, 2)
-                                }
-                        run_start = None
-
-    return best_zone
-
-
-def generate_metadata(img_dir, output_path):
-    """Generate metadata for all images."""
+    # Too few usable cells to hold even a minimum-size zone
+    if np.count_nonzero(mask) < min_cells_w * min_cells_h:
+        return None
+
+    best = None
+    best_key = None
+
+    # heights[x] = run of usable cells ending at the current row, plus a
+    # trailing zero sentinel that flushes the stack at the end of each row
+    heights = np.zeros(grid_w + 1, dtype=np.int64)
+
+    for end_y in range(1, grid_h + 1):
+        row = mask[end_y - 1]
+        heights[:grid_w] = np.where(row, heights[:grid_w] + 1, 0)
+        hist = heights.tolist()
+
+        stack = []
+        for i, h in enumerate(hist):
+            start = i
+            while stack and stack[-1][1] >= h:
+                start, zone_h = stack.pop()
+                run_len = i - start
+                if zone_h < min_cells_h or run_len < min_cells_w:
+                    continue
+
+                width_px = run_len * CELL_SIZE
+                height_px = zone_h * CELL_SIZE
+                area = width_px * height_px
+
+                # Score: use area (width * height) for balanced zones
+                # Poems need both width for text AND height for multiple lines
+                # Add small bonus for width to break ties
+                score = area + (width_px // 10)
+
+                # Only consider zones with reasonable minimum height (60px)
+                if height_px >= 60:
+                    key = (-score, end_y - zone_h, end_y, start)
+                    if best_key is None or key < best_key:
+                        best_key = key
+                        best = (start, end_y - zone_h, run_len, zone_h, area)
+            stack.append((start, h))
+
+    if best is None:
+        return None
+
+    x, y, w, h, area = best
+    avg_density = float(np.mean(density_grid[y:y+h, x:x+w]))
+    return {
+        'x': x * CELL_SIZE,
+        'y': y * CELL_SIZE,
+        'width': w * CELL_SIZE,
+        'height': h * CELL_SIZE,
+        'area': area,
+        'density': round(avg_density, 2)
+    }
+
+
+def generate_metadata(img_dir, output_path, max_workers=None):
+    """Generate metadata for all images.
+
+    Images are analyzed in parallel across processes; entries keep the
+    sorted file order.
+    """
     img_dir = Path(img_dir)
 
     metadata = {
@@ -170,26 +221,31 @@ def generate_metadata(img_dir, output_path):
         images = sorted(img_dir.glob('*_dither.png'))
     print(f"Processing {len(images)} images...")
 
-    for i, img_path in enumerate(images):
-        if i % 20 == 0:
-            print(f"  {i}/{len(images)}...")
+    records = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = executor.map(catch_errors, repeat(analyze_image_for_text_zone), images,
+                                chunksize=4)
+        for i, (img_path, (analysis, error)) in enumerate(zip(images, outcomes)):
+            if i % 20 == 0:
+                print(f"  {i}/{len(images)}...")
 
-        try:
-            analysis = analyze_image_for_text_zone(img_path)
+            if error is not None:
+                print(f"  Error processing {img_path.name}: {error}")
+                continue
 
             # Extract time from filename (first 4 chars)
             filename = img_path.name
             time_code = filename[:4]
 
-            metadata['images'][filename] = {
+            records.append((filename, {
                 'time': f'{time_code[:2]}:{time_code[2:]}',
                 'zone': analysis['zone'],
                 'best_strip': analysis['best_strip'],
                 'overall_density': round(analysis['overall_density'], 2),
                 'recommendation': get_recommendation(analysis)
-            }
-        except Exception as e:
-            print(f"  Error processing {img_path.name}: {e}")
+            }))
+
+    metadata['images'] = dict(records)
 
     # Add generation timestamp
     from datetime import datetime
@@ -205,8 +261,7 @@ def generate_metadata(img_dir, output_path):
     }
 
     # Write output
-    with open(output_path, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    write_json(metadata, output_path)
 
     print(f"\nGenerated: {output_path}")
     print(f"  Total images: {metadata['summary']['total_images']}")
@@ -0,0 +1,96 @@
+"""
+Shared Image I/O for the Living Clock Scripts
+
+Loads source images as 2D uint8 grayscale arrays and saves converted PNGs.
+PIL's convert('L') is the reference decode; OpenCV is only used where it
+gives the same pixels.
+"""
+
+import io
+import os
+from PIL import Image
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # OpenCV is optional - fall back to PIL decoding
+    cv2 = None
+
+try:
+    import oxipng
+except ImportError:  # oxipng is optional - fall back to Pillow's own zlib level
+    oxipng = None
+
+# PNG zlib level: 6 balances size and speed; --fast drops to 1 for dev iterations
+PNG_COMPRESS_LEVEL = 6
+FAST_COMPRESS_LEVEL = 1
+OXIPNG_LEVEL = 2
+
+
+def load_grayscale(image_path):
+    """Load an image as a 2D uint8 grayscale array.
+
+    Sources that are already 8-bit grayscale decode through OpenCV when it
+    is installed. Anything else goes through PIL, since OpenCV's own
+    color-to-gray conversion differs from convert('L'). EXIF orientation
+    is ignored on both paths so dimensions and zone coordinates don't
+    depend on which library is present. PIL only converts when the source
+    is not already L or 1-bit.
+    """
+    img = Image.open(image_path)
+
+    if cv2 is not None and img.mode == 'L':
+        img.close()
+        pixels = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION)
+        if pixels is None:
+            raise IOError(f"Cannot read image: {image_path}")
+        return pixels
+
+    if img.mode == '1':
+        # 1-bit pixels are already black/white - expand to 0/255 directly
+        return np.asarray(img, dtype=np.uint8) * 255
+    if img.mode != 'L':
+        img = img.convert('L')
+    return np.asarray(img)
+
+
+def save_png(img, output_path, compress_level=None, fast=False, skip_unchanged=False):
+    """Save img as a PNG, returning its size in bytes.
+
+    compress_level is the zlib level for Pillow's write. By default it is
+    PNG_COMPRESS_LEVEL, or FAST_COMPRESS_LEVEL when fast is set or oxipng
+    will recompress the stream anyway. Unless fast is set, an installed
+    oxipng recompresses the result, keeping the bit depth and color type
+    the device expects. The PNG is encoded in memory; with skip_unchanged,
+    an existing output with identical bytes is left untouched at the cost
+    of a stat (and a read when the sizes match).
+    """
+    recompress = oxipng is not None and not fast
+    if compress_level is None:
+        compress_level = FAST_COMPRESS_LEVEL if fast or recompress else PNG_COMPRESS_LEVEL
+
+    buf = io.BytesIO()
+    img.save(buf, 'PNG', compress_level=compress_level)
+    data = buf.getvalue()
+    if recompress:
+        data = oxipng.optimize_from_memory(data, level=OXIPNG_LEVEL,
+                                           strip=oxipng.StripChunks.safe(),
+                                           bit_depth_reduction=False, color_type_reduction=False,
+                                           palette_reduction=False, grayscale_reduction=False)
+
+    # Skip the write when a previous run already produced these exact bytes
+    unchanged = False
+    if skip_unchanged:
+        try:
+            unchanged = os.stat(output_path).st_size == len(data)
+            if unchanged:
+                with open(output_path, 'rb') as f:
+                    unchanged = f.read() == data
+        except FileNotFoundError:
+            unchanged = False
+
+    if not unchanged:
+        with open(output_path, 'wb') as f:
+            f.write(data)
+
+    return len(data)
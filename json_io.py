@@ -0,0 +1,24 @@
+"""
+Shared JSON Output for the Living Clock Scripts
+
+Writes analysis results and metadata as indented JSON, using orjson when it
+is installed and the stdlib json module otherwise.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional - fall back to the stdlib json module
+    orjson = None
+
+
+def write_json(obj, output_path):
+    """Write results as indented JSON, serializing NumPy values directly."""
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(output_path, 'w') as f:
+            # NumPy scalars and arrays both convert with .tolist()
+            json.dump(obj, f, indent=2, default=lambda o: o.tolist())
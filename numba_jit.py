@@ -0,0 +1,16 @@
+"""
+Optional Numba JIT for the Living Clock Scripts
+
+Exports njit and HAVE_NUMBA. Without Numba installed, njit is a no-op
+decorator, so the kernels run as plain Python and callers can check
+HAVE_NUMBA to take their NumPy path instead.
+"""
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # Numba is optional - fall back to plain Python / NumPy
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda func: func
@@ -0,0 +1,19 @@
+"""
+Process Pool Helpers for the Living Clock Scripts
+
+The batch scripts fan images out with ProcessPoolExecutor.map, which stops
+at the first exception. Wrapping each call keeps one bad image from ending
+the run, so the scripts can report it and carry on.
+"""
+
+
+def catch_errors(func, arg):
+    """Process pool worker: call func(arg), returning (result, error).
+
+    error is None on success; otherwise result is None and error is the
+    exception message.
+    """
+    try:
+        return func(arg), None
+    except Exception as e:
+        return None, str(e)